@@ -1,22 +1,35 @@
 # backend/main.py
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import docx2txt
 import PyPDF2
-from io import BytesIO
 import fitz # PyMuPDF
 import re
 import os
+import logging
+from collections import Counter
 import joblib
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
 import spacy # Import spacy for the NER model
 
 # Import your nlp_processing functions
-from backend.utils.nlp_processing import extract_skills, calculate_job_fit_score
+from backend.utils.nlp_processing import CANONICAL_SKILLS_MAP, extract_skills, extract_skills_batch, calculate_job_fit_score, get_custom_ner
+
+logger = logging.getLogger(__name__)
+
 # --- Model Loading for Job Role Classifier ---
 job_role_vectorizer = None
 job_role_model = None
+# Pieces of the fitted TfidfVectorizer used to build a request's TF-IDF row by hand
+job_role_analyzer = None
+job_role_vocabulary = None
+job_role_idf = None
 try:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     MODELS_DIR = os.path.join(BASE_DIR, 'models')
@@ -24,43 +37,103 @@ try:
     VECTORIZER_PATH = os.path.join(MODELS_DIR, 'tfidf_vectorizer.joblib')
     MODEL_PATH = os.path.join(MODELS_DIR, 'job_role_classifier_model.joblib')
 
-    job_role_vectorizer = joblib.load(VECTORIZER_PATH)
-    job_role_model = joblib.load(MODEL_PATH)
+    # Memory-map the numpy arrays read-only so forked workers share one copy via the page cache
+    job_role_vectorizer = joblib.load(VECTORIZER_PATH, mmap_mode='r')
+    job_role_model = joblib.load(MODEL_PATH, mmap_mode='r')
+    if isinstance(job_role_vectorizer, TfidfVectorizer):
+        job_role_analyzer = job_role_vectorizer.build_analyzer()
+        job_role_vocabulary = job_role_vectorizer.vocabulary_
+        job_role_idf = job_role_vectorizer.idf_ if job_role_vectorizer.use_idf else None
     print("Job Role Classifier model and vectorizer loaded successfully!")
 except Exception as e:
     print(f"Error loading job role classifier models: {e}")
     print("Please ensure you have run the Jupyter Notebook to save the models to backend/models/.")
     job_role_vectorizer = None
     job_role_model = None
+    job_role_analyzer = None
+    job_role_vocabulary = None
+    job_role_idf = None
+
+# --- Custom Skills NER Model (opt-in via USE_CUSTOM_NER=1) ---
+# nlp_processing loads it lazily; the app forces the load at import so that under
+# `gunicorn --preload` it happens once in the parent and the forked workers share
+# its memory copy-on-write instead of each loading their own copy.
+get_custom_ner()
+
+# --- spaCy Pipeline for Job Description Parsing ---
+# The JD view only needs skill, education and experience spans, so a small pretrained
+# pipeline plus an EntityRuler seeded from our skill aliases is enough (no need for en_core_web_lg).
+# Only doc.ents is read from this model, so skip every component NER doesn't need.
+JD_NER_DISABLED_COMPONENTS = ["tagger", "parser", "attribute_ruler", "lemmatizer"]
+
+# Single letters and everyday words that would fire on ordinary prose
+JD_RULER_AMBIGUOUS_ALIASES = {"c", "r", "go"}
+
+JD_ENTITY_PATTERNS = [
+    {"label": "SKILL", "pattern": alias, "id": canonical_name}
+    for alias, canonical_name in CANONICAL_SKILLS_MAP.items()
+    if alias not in JD_RULER_AMBIGUOUS_ALIASES
+] + [
+    # e.g. "Bachelor's degree", "Masters", "PhD"
+    {"label": "EDU", "pattern": [
+        {"LOWER": {"IN": ["bachelor", "bachelors", "master", "masters", "phd", "ph.d", "ph.d.", "doctorate"]}},
+        {"ORTH": "'s", "OP": "?"},
+        {"LOWER": "degree", "OP": "?"},
+    ]},
+    # e.g. "5 years", "3+ years", "2-4 yrs"
+    {"label": "EXPERIENCE", "pattern": [
+        {"LIKE_NUM": True},
+        {"ORTH": {"IN": ["+", "-"]}, "OP": "?"},
+        {"LIKE_NUM": True, "OP": "?"},
+        {"LOWER": {"IN": ["year", "years", "yr", "yrs"]}},
+    ]},
+]
 
-# --- Custom NER Model Loading for Job Description Parsing ---
-# We will load a pre-trained large spaCy model instead of custom-trained
 jd_ner_model = None
 try:
-    # Attempt to load the large English model first
-    jd_ner_model = spacy.load("en_core_web_lg")
-    print("Pre-trained 'en_core_web_lg' spaCy model loaded successfully for JD parsing!")
+    jd_ner_model = spacy.load("en_core_web_sm", disable=JD_NER_DISABLED_COMPONENTS)
+    print("Pre-trained 'en_core_web_sm' spaCy model loaded successfully for JD parsing!")
 except OSError:
-    print("SpaCy model 'en_core_web_lg' not found. Attempting to download...")
+    print("SpaCy model 'en_core_web_sm' not found. Attempting to download...")
     try:
-        spacy.cli.download("en_core_web_lg")
-        jd_ner_model = spacy.load("en_core_web_lg")
-        print("Downloaded and loaded 'en_core_web_lg' for JD parsing!")
+        spacy.cli.download("en_core_web_sm")
+        jd_ner_model = spacy.load("en_core_web_sm", disable=JD_NER_DISABLED_COMPONENTS)
+        print("Downloaded and loaded 'en_core_web_sm' for JD parsing!")
     except Exception as download_e:
-        print(f"Error downloading 'en_core_web_lg': {download_e}")
-        print("Falling back to 'en_core_web_sm' for JD parsing.")
-        try:
-            jd_ner_model = spacy.load("en_core_web_sm")
-            print("Loaded 'en_core_web_sm' for JD parsing.")
-        except OSError:
-            print("Error: Neither 'en_core_web_lg' nor 'en_core_web_sm' found. JD parsing will be limited.")
-            jd_ner_model = None
+        print(f"Error downloading 'en_core_web_sm': {download_e}")
+        print("JD parsing will be limited.")
+        jd_ner_model = None
 except Exception as e:
     print(f"An unexpected error occurred loading spaCy model: {e}")
     jd_ner_model = None
 
+if jd_ner_model:
+    # Rule-based spans run before the statistical NER so it can't overwrite them
+    jd_entity_ruler = jd_ner_model.add_pipe("entity_ruler", before="ner", config={"phrase_matcher_attr": "LOWER"})
+    jd_entity_ruler.add_patterns(JD_ENTITY_PATTERNS)
+
+# --- Contact Detail Patterns (compiled once, shared by all requests) ---
+EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+PHONE_RE = re.compile(r"(\+\d{1,3})?\s*\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}")
+
+
+# Sample text used to push every model through one real call before serving
+WARMUP_TEXT = "Python developer with 5 years of experience in AWS and Machine Learning. Bachelor's degree."
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Run each loaded model once at startup so the first real request doesn't pay for
+    # lazy initialisation (thinc ops buffers, first Cython allocations, sklearn checks)
+    extract_skills(WARMUP_TEXT)
+    if jd_ner_model:
+        jd_ner_model(WARMUP_TEXT)
+    if job_role_model and job_role_vectorizer:
+        job_role_model.predict(_vectorize_skills(WARMUP_TEXT))
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -71,25 +144,50 @@ app.add_middleware(
 )
 
 # Utility functions for text extraction from files
+# Each extractor is synchronous and reads from the upload's spooled file object.
+# UploadFile is already backed by a SpooledTemporaryFile (in memory up to a small
+# threshold, on disk beyond it), so parsers read from it directly where they can
+# instead of us copying the whole upload into a bytes object first.
+def _extract_pdf_text(file_obj) -> str:
+    # PyMuPDF needs the raw bytes, so PDFs are still read in full.
+    # Join page texts in one go and close the document as soon as we're done
+    with fitz.open(stream=file_obj.read(), filetype="pdf") as doc:
+        return "\n".join(page.get_text("text") for page in doc)
+
+
+def _extract_docx_text(file_obj) -> str:
+    # docx2txt opens the file as a zip archive, which only needs a seekable file object
+    return docx2txt.process(file_obj)
+
+
+# Content type -> (format name for error messages, extractor)
+_EXTRACTORS = {
+    "application/pdf": ("PDF", _extract_pdf_text),
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ("DOCX", _extract_docx_text),
+}
+
+
 async def _extract_text_from_file(file: UploadFile) -> str:
-    file_content = await file.read()
-    if file.content_type == "application/pdf":
-        try:
-            doc = fitz.open(stream=file_content, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            return text
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error processing PDF: {e}")
-    elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        try:
-            text = docx2txt.process(BytesIO(file_content))
-            return text
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error processing DOCX: {e}")
-    else:
+    if file.content_type not in _EXTRACTORS:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
+    file_format, extractor = _EXTRACTORS[file.content_type]
+
+    await file.seek(0)
+    try:
+        # Parsing is CPU-bound, so it runs in the threadpool to keep the event loop free.
+        return await run_in_threadpool(extractor, file.file)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing {file_format}: {e}")
+
+
+def _extract_contact_details(resume_text: str) -> dict:
+    """Finds the first email address and phone number in the resume text."""
+    email_match = EMAIL_RE.search(resume_text)
+    phone_match = PHONE_RE.search(resume_text)
+    return {
+        "email": email_match.group(0) if email_match else "Not Found",
+        "phone": phone_match.group(0) if phone_match else "Not Found",
+    }
 
 
 @app.get("/test")
@@ -106,15 +204,11 @@ async def extract_resume_data_endpoint(resume_file: UploadFile = File(...)):
         resume_text = await _extract_text_from_file(resume_file)
         
         # Use your nlp_processing.py to extract skills
-        extracted_skills_list = extract_skills(resume_text)
-
-        email_match = re.search(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", resume_text)
-        phone_match = re.search(r"(\+\d{1,3})?\s*\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}", resume_text)
+        extracted_skills_list = await run_in_threadpool(extract_skills, resume_text)
 
         resume_info = {
             "filename": resume_file.filename,
-            "email": email_match.group(0) if email_match else "Not Found",
-            "phone": phone_match.group(0) if phone_match else "Not Found",
+            **_extract_contact_details(resume_text),
             "extracted_skills": extracted_skills_list,
             "education": ["Education parsing not yet fully implemented for this endpoint"],
             "experience": ["Experience parsing not yet fully implemented for this endpoint"],
@@ -139,11 +233,10 @@ async def compare_resume_and_jd(resume_file: UploadFile = File(...), jd_file: Up
         resume_text = await _extract_text_from_file(resume_file)
         jd_text = await _extract_text_from_file(jd_file)
 
-        # 2. Extract skills from resume using nlp_processing.py (rule-based)
-        resume_skills = extract_skills(resume_text)
+        # 2. Extract skills from resume and JD in one batched pass (rule-based)
+        resume_skills, jd_skills_for_comparison = await run_in_threadpool(extract_skills_batch, [resume_text, jd_text])
 
-        # 3. Use pre-trained spaCy model for Job Description parsing (for display purposes)
-        # This will extract general entities, not your custom ones directly
+        # 3. Use the spaCy pipeline + EntityRuler for Job Description parsing (for display purposes)
         parsed_jd_details_from_ner = {
             "required_skills_ner": [],
             "experience_level_ner": "",
@@ -151,56 +244,44 @@ async def compare_resume_and_jd(resume_file: UploadFile = File(...), jd_file: Up
         }
         
         if jd_ner_model:
-            doc = jd_ner_model(jd_text)
+            doc = await run_in_threadpool(jd_ner_model, jd_text)
             
-            # --- DEBUG PRINTS FOR PRE-TRAINED NER MODEL START ---
-            print("\n--- Debug: Pre-trained SpaCy Model Entities Detected in JD ---")
+            # --- DEBUG LOGGING FOR PRE-TRAINED NER MODEL (no formatting cost unless DEBUG is enabled) ---
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
             if doc.ents:
                 for ent in doc.ents:
-                    print(f"  Entity: '{ent.text}' | Label: '{ent.label_}' | Span: [{ent.start_char}:{ent.end_char}]")
-                    # Attempt to map general NER entities to your desired categories
-                    # This is a heuristic and will not be perfect but provides some structure
-                    if ent.label_ in ['SKILL', 'LANGUAGE', 'PRODUCT', 'ORG', 'NORP', 'FAC', 'GPE', 'PERSON', 'LOC']: # Common relevant labels for skills/tech
-                        parsed_jd_details_from_ner["required_skills_ner"].append(ent.text)
-                    elif ent.label_ in ['DATE', 'CARDINAL', 'QUANTITY']: # Heuristic for experience
-                        # Check for terms commonly associated with experience levels
-                        if 'year' in ent.text.lower() or 'experience' in ent.text.lower() or re.search(r'\d+\+', ent.text):
-                             if not parsed_jd_details_from_ner["experience_level_ner"]: # Only take the first relevant one
-                                parsed_jd_details_from_ner["experience_level_ner"] = ent.text
-                    elif ent.label_ in ['ORG', 'EDU', 'GPE']: # Heuristic for education
-                         # Check for terms commonly associated with education
-                         if 'university' in ent.text.lower() or 'college' in ent.text.lower() or 'degree' in ent.text.lower() or 'ph.d' in ent.text.lower() or 'bachelor' in ent.text.lower() or 'master' in ent.text.lower():
-                            if not parsed_jd_details_from_ner["educational_requirements_ner"]: # Only take the first relevant one
-                                parsed_jd_details_from_ner["educational_requirements_ner"] = ent.text
-            else:
-                print("  No entities detected by pre-trained spaCy model for this JD.")
-            print("--- Debug: Pre-trained SpaCy Model Entities Detected End ---\n")
-            # --- DEBUG PRINTS FOR PRE-TRAINED NER MODEL END ---
-
-            # Deduplicate skills for display
-            parsed_jd_details_from_ner["required_skills_ner"] = list(set(parsed_jd_details_from_ner["required_skills_ner"]))
+                    if debug_enabled:
+                        logger.debug("JD entity: %r | Label: %r | Span: [%d:%d]", ent.text, ent.label_, ent.start_char, ent.end_char)
+                    # SKILL and EDU spans come from the EntityRuler; experience may also be a plain DATE span
+                    if ent.label_ == "SKILL":
+                        parsed_jd_details_from_ner["required_skills_ner"].append(ent.ent_id_ or ent.text)
+                    elif ent.label_ == "EXPERIENCE" or (ent.label_ == "DATE" and 'year' in ent.text.lower()):
+                        if not parsed_jd_details_from_ner["experience_level_ner"]: # Only take the first relevant one
+                            parsed_jd_details_from_ner["experience_level_ner"] = ent.text
+                    elif ent.label_ == "EDU":
+                        if not parsed_jd_details_from_ner["educational_requirements_ner"]: # Only take the first relevant one
+                            parsed_jd_details_from_ner["educational_requirements_ner"] = ent.text
+            elif debug_enabled:
+                logger.debug("No entities detected by pre-trained spaCy model for this JD.")
+
+            # Deduplicate skills for display, keeping the order they appear in the JD
+            parsed_jd_details_from_ner["required_skills_ner"] = list(dict.fromkeys(parsed_jd_details_from_ner["required_skills_ner"]))
 
 
             # CRITICAL: Use rule-based skills for comparison to maintain accuracy for now
-            jd_skills_for_comparison = extract_skills(jd_text) 
-            print("Note: Using rule-based skills for JD comparison to maintain accuracy.")
+            logger.debug("Using rule-based skills for JD comparison to maintain accuracy.")
 
         else:
             # Fallback to rule-based skill extraction for JD if NO spaCy model is loaded
-            jd_skills_for_comparison = extract_skills(jd_text)
-            print("Warning: No spaCy model loaded for JD parsing, falling back to rule-based JD skill extraction.")
+            logger.warning("No spaCy model loaded for JD parsing, falling back to rule-based JD skill extraction.")
 
         # 4. Calculate job fit score using the reliable extracted skills
         comparison_results = calculate_job_fit_score(resume_skills, jd_skills_for_comparison)
         
         # Prepare resume_info for the frontend response
-        email_match = re.search(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", resume_text)
-        phone_match = re.search(r"(\+\d{1,3})?\s*\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}", resume_text)
-
         response_resume_info = {
             "filename": resume_file.filename,
-            "email": email_match.group(0) if email_match else "Not Found",
-            "phone": phone_match.group(0) if phone_match else "Not Found",
+            **_extract_contact_details(resume_text),
             "education": ["Education parsing not yet fully implemented for display"],
             "experience": ["Experience parsing not yet fully implemented for display"],
             "full_resume_text": resume_text
@@ -211,7 +292,7 @@ async def compare_resume_and_jd(resume_file: UploadFile = File(...), jd_file: Up
             "resume_info": response_resume_info,
             "jd_extracted_skills": jd_skills_for_comparison, # This is the rule-based list for the fit score display
             "comparison_results": comparison_results,
-            "parsed_jd_details": parsed_jd_details_from_ner # NEW: Now from the pre-trained spaCy NER model
+            "parsed_jd_details": parsed_jd_details_from_ner # From the spaCy pipeline + EntityRuler
         })
 
     except HTTPException as e:
@@ -220,6 +301,48 @@ async def compare_resume_and_jd(resume_file: UploadFile = File(...), jd_file: Up
         raise HTTPException(status_code=500, detail=f"Server error during comparison: {e}")
 
 
+def _vectorize_skills(skills_string: str):
+    """
+    Builds the 1-row TF-IDF matrix for a skills string straight from the fitted
+    vocabulary and IDF weights. Equivalent to job_role_vectorizer.transform([skills_string])
+    but skips sklearn's per-call validation and sparse-matrix plumbing.
+    """
+    if job_role_analyzer is None:
+        return job_role_vectorizer.transform([skills_string])
+
+    term_counts = Counter(
+        job_role_vocabulary[term] for term in job_role_analyzer(skills_string) if term in job_role_vocabulary
+    )
+    indices = np.array(sorted(term_counts), dtype=np.int32)
+    data = np.array([term_counts[j] for j in indices], dtype=job_role_vectorizer.dtype)
+
+    if job_role_vectorizer.binary:
+        data[:] = 1
+    if job_role_vectorizer.sublinear_tf:
+        data = np.log(data) + 1
+    if job_role_idf is not None:
+        data = data * job_role_idf[indices]
+    if job_role_vectorizer.norm == "l2":
+        norm = np.sqrt(np.dot(data, data))
+    elif job_role_vectorizer.norm == "l1":
+        norm = np.abs(data).sum()
+    else:
+        norm = 0
+    if norm > 0:
+        data = data / norm
+
+    return csr_matrix((data, indices, [0, len(indices)]), shape=(1, len(job_role_vocabulary)))
+
+
+def _predict_job_role_from_text(resume_full_text: str) -> str:
+    """Runs skill extraction, TF-IDF vectorization and classification (all CPU-bound)."""
+    extracted_resume_skills = extract_skills(resume_full_text)
+    processed_skills_string = " ".join(extracted_resume_skills)
+
+    transformed_skills = _vectorize_skills(processed_skills_string)
+    return job_role_model.predict(transformed_skills)[0]
+
+
 @app.post("/predict-job-role/")
 async def predict_job_role(request_data: dict):
     """
@@ -232,10 +355,6 @@ async def predict_job_role(request_data: dict):
     if not resume_full_text:
         raise HTTPException(status_code=400, detail="No full resume text provided for job role prediction.")
 
-    extracted_resume_skills = extract_skills(resume_full_text)
-    processed_skills_string = " ".join(extracted_resume_skills)
-
-    transformed_skills = job_role_vectorizer.transform([processed_skills_string])
-    predicted_role = job_role_model.predict(transformed_skills)[0]
+    predicted_role = await run_in_threadpool(_predict_job_role_from_text, resume_full_text)
     
     return {"predicted_job_role": predicted_role}
\ No newline at end of file
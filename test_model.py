@@ -1,18 +1,34 @@
-import spacy
+import argparse
 
-# Load your CPU-trained test model
-nlp = spacy.load("backend/models/ner_test/model-last")
+import spacy
 
-# Example text (you can replace this with any resume text)
-text = """
-John Doe is a software engineer with 5 years of experience in Python, 
+# Example text (you can replace this with any resume text, or pass --text)
+DEFAULT_TEXT = """
+John Doe is a software engineer with 5 years of experience in Python,
 Machine Learning, and AWS. He also knows JavaScript and has worked on NLP projects.
 """
 
-# Process the text
-doc = nlp(text)
 
-# Print extracted entities
-print("Detected entities:")
-for ent in doc.ents:
-    print(f"{ent.text} -> {ent.label_}")
+def main():
+    parser = argparse.ArgumentParser(description="Print the entities a trained NER model finds in a text.")
+    parser.add_argument("--model", default="backend/models/ner_test/model-last", help="Path to the spaCy model to load.")
+    parser.add_argument("--text", default=DEFAULT_TEXT, help="Text to run through the model.")
+    args = parser.parse_args()
+
+    # Load your CPU-trained test model (only the NER pipeline is needed to print entities)
+    nlp = spacy.load(
+        args.model,
+        exclude=["tagger", "parser", "lemmatizer", "attribute_ruler", "senter", "morphologizer"],
+    )
+
+    # Process the text
+    doc = nlp(args.text)
+
+    # Print extracted entities
+    print("Detected entities:")
+    for ent in doc.ents:
+        print(f"{ent.text} -> {ent.label_}")
+
+
+if __name__ == "__main__":
+    main()